@@ -6,56 +6,148 @@
 # that are not 2^n + 1
 # It accepts (non-jagged) 2D arrays of any (sensible) side lengths.
 # It uses randomization to select indexes, and interpolation when a nx1 length remains unfilled.
+# The heightmap is a 2D numpy array, indexed as world_map[x, y]. Without numpy, it is a HeightMap.
+# The algorithm itself is compiled with numba when it is installed. Otherwise, the native version in
+# aug_ds_native.pyx is used if it has been built (cythonize -3 --inplace aug_ds_native.pyx),
+# and else it runs as plain Python.
 # Print/plot functions are also supplied. Plotting requires matplotlib and numpy.
 
 
+import array
 import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional: without it, heightmaps are HeightMaps, and the algorithm runs as plain Python
+    np = None
+
+try:
+    from numba import njit
+    NUMBA = True
+except ImportError:
+    # numba is optional: fall back to a decorator that leaves the function as is
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+    NUMBA = False
+
+# Types of PRNG states (unsigned 64 bit) and numbers drawn from them. Compiled code needs
+# numpy types, while python ints are faster than numpy scalars in plain Python.
+UINT64, INT64 = (np.uint64, np.int64) if NUMBA else (int, int)
+UINT64_MASK = UINT64((1 << 64) - 1)
+# Shifts of the xorshift64 PRNG, as UINT64 to keep compiled shifts of the state unsigned.
+# They are converted once here, as the conversions would cost as much as the shifts in plain Python.
+XORSHIFT_A, XORSHIFT_B, XORSHIFT_C = UINT64(13), UINT64(7), UINT64(17)
+
+try:
+    import aug_ds_native
+except ImportError:
+    aug_ds_native = None
 
 HEIGHT_VARIATION_FACTOR = 0.2       # Magnitude of height deviations
 RANDOMIZATION_SCALE_FACTOR = 0.2    # Magnitude of random index variations
 
+PAR_THRESHOLD = 1 << 20 # Areas larger than this (in cells) are split in four, which are processed in parallel
+
+RAND_BITS = 16  # Random numbers used by the algorithm are integers in [0, 2^RAND_BITS)
+RAND_SHIFT = UINT64(64 - RAND_BITS) # They are the RAND_BITS high bits of the PRNG state
+# The factors as fractions, so deviations and random indexes can be computed with integers only
+HEIGHT_VARIATION_NUM, HEIGHT_VARIATION_DEN = \
+    Fraction(HEIGHT_VARIATION_FACTOR).limit_denominator(1000).as_integer_ratio()
+RANDOMIZATION_SCALE_NUM, RANDOMIZATION_SCALE_DEN = \
+    Fraction(RANDOMIZATION_SCALE_FACTOR).limit_denominator(1000).as_integer_ratio()
+if aug_ds_native is not None:
+    aug_ds_native.setFactors(RAND_BITS, HEIGHT_VARIATION_NUM, HEIGHT_VARIATION_DEN,
+                             RANDOMIZATION_SCALE_NUM, RANDOMIZATION_SCALE_DEN)
+
+"""
+Heightmap stored in a flat array.array, for use where numpy isn't installed.
+The heights are stored unboxed and contiguously, row by row, so cell (x, y) is hm[x, y] = data[x*ny + y].
+It can be passed to randAugDS, printWorld and plotWorld3D. randAugDS runs on a numpy view of the same
+memory if numpy is installed, and else runs flatRandAugDS on the data.
+@arg nx, ny: Side lengths of the heightmap, which must be at least 2
+@arg typecode: array.array typecode of the heights. 'h' (16 bit) fits side lengths up to ~20000.
+"""
+class HeightMap:
+    def __init__(self, nx, ny, typecode='h'):
+        if nx < 2 or ny < 2:
+            raise ValueError("HeightMap side lengths must be at least 2, got %dx%d" % (nx, ny))
+        self.shape = (nx, ny)
+        self.data = array.array(typecode, bytes(nx * ny * array.array(typecode).itemsize))
+
+    def __getitem__(self, xy):
+        return self.data[self.index(*xy)]
+
+    def __setitem__(self, xy, value):
+        self.data[self.index(*xy)] = value
+
+    """
+    Returns the index of cell (x, y) in data.
+    Raises IndexError for cells outside the heightmap, as a wrong x or y could else give another cell.
+    """
+    def index(self, x, y):
+        nx, ny = self.shape
+        if not (0 <= x < nx and 0 <= y < ny):
+            raise IndexError("cell (%d, %d) is outside the %dx%d heightmap" % (x, y, nx, ny))
+        return x * ny + y
+
+    """
+    Returns the heightmap as a list of rows.
+    """
+    def tolist(self):
+        ny = self.shape[1]
+        return [self.data[x*ny:(x+1)*ny].tolist() for x in range(self.shape[0])]
+
+    """
+    Returns a 2D numpy array sharing memory with the heightmap. Requires numpy.
+    """
+    def asarray(self):
+        return np.frombuffer(self.data, dtype=self.data.typecode).reshape(self.shape)
+
+
 """
 Prints a world heightmap.
-@arg world_map: 2d array, heightmap.
+@arg world_map: 2d array (or HeightMap), heightmap.
 """
 def printWorld(world_map):
-    ylength = len(world_map[0])
-    counter = 0
+    ylength = world_map.shape[1]
     marks = ylength // 5
     # Index in y-axis
-    print("    ", end="")
-    for i in range(marks):
-        print(str(i*5).ljust(15, '-'), end="")
-    print("Y")
+    lines = ["    " + "".join(str(i*5).ljust(15, '-') for i in range(marks)) + "Y"]
 
-    for row in world_map:
+    row_format = "%-3d" * ylength # = str(elem).ljust(3) for each elem in a row
+    for counter, row in enumerate(world_map.tolist()):
         # Index in x-axis
-        print(str(counter).ljust(4) if (counter % 5) == 0 else "|   ", end= "")
-        counter += 1
-        
-        for elem in row:
-            print(str(elem).ljust(3), end="")
-        print()
-    print("X")
+        lines.append((str(counter).ljust(4) if (counter % 5) == 0 else "|   ") + row_format % tuple(row))
+    lines.append("X\n")
+
+    # Write all output at once
+    sys.stdout.write("\n".join(lines))
 
 
 """
 Plots a world heightmap.
-@arg world_map: 2d array, heightmap.
+@arg world_map: 2d array (or HeightMap), heightmap.
 """
 def plotWorld3D(world_map):
     from mpl_toolkits.mplot3d import Axes3D
     import matplotlib.pyplot as plt
     from matplotlib import cm
-    import numpy as np
+
+    if isinstance(world_map, HeightMap):
+        world_map = world_map.asarray()
     
-    Y = [i for i in range(len(world_map   ))]
-    X = [i for i in range(len(world_map[0]))]
-    X, Y = np.meshgrid(X, Y)
+    # Sparse grid: X is a row, Y a column, and plot_surface broadcasts them against world_map
+    Y, X = np.ogrid[:world_map.shape[0], :world_map.shape[1]]
 
     fig = plt.figure()
-    ax = fig.gca(projection='3d')
-    surf = ax.plot_surface(X, Y, world_map, cmap=cm.spectral,
+    ax = fig.add_subplot(projection='3d')
+    surf = ax.plot_surface(X, Y, world_map, cmap=cm.nipy_spectral,
                        linewidth=0, antialiased=False)
     fig.colorbar(surf, shrink=0.5, aspect=5)
     # It seems numpy defines y as len(array), which is the opposite of what I have done.
@@ -68,12 +160,49 @@ def plotWorld3D(world_map):
 
 
 """
-Deviation of a value in the heightmap from the averages of the surrounding values.
+Advances the state of the xorshift64 PRNG used by the algorithm.
+The state is a nonzero UINT64, which the compiled algorithm keeps in a register.
+@arg state: PRNG state
+"""
+@njit(cache=True)
+def xorshift(state):
+    state ^= (state << XORSHIFT_A) & UINT64_MASK
+    state ^= state >> XORSHIFT_B
+    state ^= (state << XORSHIFT_C) & UINT64_MASK
+    return state
+
+"""
+Returns a random number in [0, 2^RAND_BITS) from a PRNG state: its RAND_BITS high bits.
+@arg state: PRNG state, advanced by xorshift(state) for every number
+"""
+@njit(cache=True)
+def randBits(state):
+    return INT64(state >> RAND_SHIFT)
+
+"""
+Returns a nonzero PRNG state for the algorithm.
+@arg rng: numpy Generator
+"""
+def newState(rng):
+    return UINT64(rng.integers(1, 1 << 64, dtype=np.uint64))
+
+"""
+Maximum deviation of a value in the heightmap from the averages of the surrounding values.
 HEIGHT_VARIATION_FACTOR determines the magnitude of the deviation.
-@arg x0, y0, x1, y1: Coords of corners.
+@arg span: Side length of the area the value is in. For the centre of an area, the longest side.
+"""
+@njit(cache=True)
+def devAmplitude(span):
+    return (span * HEIGHT_VARIATION_NUM) // HEIGHT_VARIATION_DEN
+
 """
-def dev(x0, y0, x1, y1):
-    return int(HEIGHT_VARIATION_FACTOR * random.randint(-max(x1-x0, y1-y0), max(x1-x0, y1-y0)))
+Deviation of a value in the heightmap from the averages of the surrounding values.
+@arg amplitude: Maximum deviation, from devAmplitude(span).
+@arg r: Random number in [0, 2^RAND_BITS), from randBits().
+"""
+@njit(cache=True)
+def dev(amplitude, r):
+    return (((2*amplitude + 1) * r) >> RAND_BITS) - amplitude # = randint(-amplitude, amplitude)
 
 """
 Returns a random index around the middle of i0 and i1.
@@ -81,8 +210,10 @@ The val RANDOMIZATION_SCALE_FACTOR determines how far from the midpoint the retu
 If the factor is 1, we can get any index between i0 or i1 as return value
 If it is 0, we can only get the midpoint
 @arg i0,i1: Max/min indexes for a heightmap axis for this step.
+@arg r: Random number in [0, 2^RAND_BITS), from randBits().
 """
-def randAugIndex(i0, i1):
+@njit(cache=True)
+def randAugIndex(i0, i1, r):
     # Check the indexes
     if i0 == i1 or i1 < i0:
         return i0
@@ -91,7 +222,9 @@ def randAugIndex(i0, i1):
     elif i0 + 2 == i1: # Only one index in between
         return i0 + 1
     # Calc new index & assure it is between i0 and i1 (and not equal either)
-    i = int(i0 + (RANDOMIZATION_SCALE_FACTOR * random.random() + 1)*(i1-i0)/2)
+    # = int(i0 + (RANDOMIZATION_SCALE_FACTOR * u + 1)*(i1-i0)/2), where u = r / 2^RAND_BITS
+    i = i0 + ((i1 - i0) * (RANDOMIZATION_SCALE_NUM * r + (RANDOMIZATION_SCALE_DEN << RAND_BITS))) \
+        // (RANDOMIZATION_SCALE_DEN << (RAND_BITS + 1))
     if i == i0:
         i += 1 # We know there is at least two indexes between i0 and i1
     elif i == i1:
@@ -100,75 +233,369 @@ def randAugIndex(i0, i1):
     return i
 
 """
-Square step of the DS Algorithm.
-Sets height values of 4 cells, which are the corners of next step's four diamond calls.
+Returns int(x / 3), using a multiply and shift instead of a division.
+0xAAAAAAAB / 2^33 is slightly above 1/3, which gives the exact result for |x| < 2^31.
+@arg x: Integer to divide
+"""
+@njit(cache=True)
+def div3(x):
+    if x >= 0:
+        return (x * 0xAAAAAAAB) >> 33
+    return -((-x * 0xAAAAAAAB) >> 33)
+
+"""
+Diamond and square steps of the DS Algorithm, fused into one step.
+Diamond: Sets the centre of the area equal to the average of the corners, plus a random deviation.
+Square: Sets height values of 4 cells, which are the corners of next step's four diamond steps.
+The corner and centre heights are loaded once, and reused by both steps.
+Heights are loaded as int, so sums don't overflow small heightmap dtypes like np.int16.
 @arg world_map: 2D non-jagged array representing a heightmap
 @arg x0,y0,x1,y1: Coordinates for corners (delimiters) of the area we're modifying 
                   in this step.
 @arg i,j: Coordinates for the centre of the area, which is also a corner of the areas of the next step
+@arg state: PRNG state
+@return: The new PRNG state
 """
-def Square(world_map, x0, y0, x1, y1, i, j):
-    deviation =  dev(y0, y0, y1, y1) # = randint(-(y1-y0), (y1-y0)), where y1-y0 is the side length
-    world_map[x0][j] = deviation + int(( world_map[x0][y0] + world_map[x0][y1] + world_map[i][j] ) / 3 )
-    deviation =  dev(y0, y0, y1, y1)
-    world_map[x1][j] = deviation + int(( world_map[x1][y0] + world_map[x1][y1] + world_map[i][j] ) / 3 )
-    deviation =  dev(x0, x0, x1, x1)
-    world_map[i][y0] = deviation + int(( world_map[x0][y0] + world_map[x1][y0] + world_map[i][j] ) / 3 )
-    deviation =  dev(x0, x0, x1, x1)
-    world_map[i][y1] = deviation + int(( world_map[x0][y1] + world_map[x1][y1] + world_map[i][j] ) / 3 )
-    return
+@njit(cache=True)
+def DiamondSquare(world_map, x0, y0, x1, y1, i, j, state):
+    w = world_map
+    # Deviation amplitudes for the square step, and for the diamond step (the longest side)
+    amp_x = devAmplitude(x1 - x0)
+    amp_y = devAmplitude(y1 - y0)
+    amp_c = max(amp_x, amp_y)
+    a = int(w[x0, y0])
+    b = int(w[x1, y0])
+    c = int(w[x0, y1])
+    d = int(w[x1, y1])
+
+    # Diamond step
+    # Test here what kinds of terrain max & min give!
+    state = xorshift(state)
+    centre = dev(amp_c, randBits(state)) + int(( a + b + c + d ) / 4)
+    w[i, j] = centre
+
+    # Square step. Compiled code divides by 3 with div3, while plain Python saves the calls.
+    if NUMBA:
+        ac = div3(a + c + centre)
+        bd = div3(b + d + centre)
+        ab = div3(a + b + centre)
+        cd = div3(c + d + centre)
+    else:
+        ac = int((a + c + centre) / 3)
+        bd = int((b + d + centre) / 3)
+        ab = int((a + b + centre) / 3)
+        cd = int((c + d + centre) / 3)
+    state = xorshift(state)
+    w[x0, j] = dev(amp_y, randBits(state)) + ac
+    state = xorshift(state)
+    w[x1, j] = dev(amp_y, randBits(state)) + bd
+    state = xorshift(state)
+    w[i, y0] = dev(amp_x, randBits(state)) + ab
+    state = xorshift(state)
+    w[i, y1] = dev(amp_x, randBits(state)) + cd
+    return state
 
 """
-Diamond step of the DS Algorithm.
-Sets the centre of the heightmap equal to the average of the corners, plus a random deviation.
+Fills the rest of an area by interpolation, if it is a line (n x 1) and can't be split.
+Interpolation creates a slope between the two ends of the line.
 @arg world_map: 2D non-jagged array representing a heightmap
 @arg x0,y0,x1,y1: Coordinates for corners (delimiters) of the area we're modifying 
                   in this step.
-@arg i,j: Coordinates for the centre of the area, which is also a corner of the areas of the next step
+@arg i,j: Coordinates for the centre of the area
+@return: True if the area was interpolated, False if it should be split.
 """
-def Diamond(world_map, x0, y0, x1, y1, i, j):
-    # Test here what kinds of terrain max & min give!
-    deviation = dev(x0, y0, x1, y1)
-    world_map[i][j] = deviation + int(( world_map[x0][y0] + world_map[x1][y0] + world_map[x0][y1] + world_map[x1][y1] ) / 4)
-    return
+@njit(cache=True, inline='always')
+def interpolate(world_map, x0, y0, x1, y1, i, j):
+    if   i == x0 or i == x1:
+        h0 = int(world_map[i, y0])
+        dh = int(world_map[i, y1]) - h0
+        for y in range(y0 + 1, y1):
+            world_map[i, y] = h0 + dh * (y - y0) // (y1 - y0)
+        return True
+    elif j == y0 or j == y1: 
+        h0 = int(world_map[x0, j])
+        dh = int(world_map[x1, j]) - h0
+        for x in range(x0 + 1, x1):
+            world_map[x, j] = h0 + dh * (x - x0) // (x1 - x0)
+        return True
+    return False
+
+"""
+Pushes the four areas an area is split into onto the stack of areas left to process.
+They are pushed in reverse, so (x0, y0, i, j) is processed first.
+Depth first order finishes each area before moving on, so small areas are processed
+while they are in cache, and the x0..i rows are done before the i..x1 rows.
+@arg stack, top: Stack of (x0, y0, x1, y1) areas, and its number of areas
+@arg x0,y0,x1,y1: Coordinates for corners of the split area
+@arg i,j: Coordinates for the centre of the split area, which is a corner of all four areas
+@return: The new number of areas on the stack
+"""
+@njit(cache=True, inline='always')
+def pushAreas(stack, top, x0, y0, x1, y1, i, j):
+    n = 4 * top
+    stack[n] = i
+    stack[n + 1] = j
+    stack[n + 2] = x1
+    stack[n + 3] = y1
+    stack[n + 4] = i
+    stack[n + 5] = y0
+    stack[n + 6] = x1
+    stack[n + 7] = j
+    stack[n + 8] = x0
+    stack[n + 9] = j
+    stack[n + 10] = i
+    stack[n + 11] = y1
+    stack[n + 12] = x0
+    stack[n + 13] = y0
+    stack[n + 14] = i
+    stack[n + 15] = j
+    return top + 4
+
+"""
+Returns a stack for auxRandAugDS/auxPowTwoDS holding the area (x0, y0, x1, y1).
+The areas are stored flat, area n being stack[4*n : 4*n + 4].
+Each step shrinks both side lengths by at least 1, and leaves 3 areas on the stack,
+which bounds its size.
+Compiled code uses an int32 array. Plain Python uses a list, whose items are python ints:
+numpy scalars read from an array would make all index arithmetic slow.
+@arg x0,y0,x1,y1: Coordinates for corners of the area
+"""
+@njit(cache=True)
+def newStack(x0, y0, x1, y1):
+    size = 4 * (3 * min(x1 - x0, y1 - y0) + 1)
+    stack = np.empty(size, np.int32) if NUMBA else [0] * size
+    stack[0] = x0
+    stack[1] = y0
+    stack[2] = x1
+    stack[3] = y1
+    return stack
 
 """
 The actual implementation of the DS algo.
 The coordinate arguments are two corners of the square part of the algorithm.
+Areas left to process are kept on an explicit stack instead of recursing, and are
+processed in the same (depth first) order as a recursive implementation would.
 @arg world_map: 2D non-jagged array representing a heightmap
+@arg state: Nonzero PRNG state, see newState()
 @arg x0,y0,x1,y1: Coordinates for corners (delimiters) of the area we're modifying 
                   in this step.
 """
-def auxRandAugDS(world_map, x0, y0, x1, y1):
-    if x0 == x1 and y0 == y1:
-        return
+@njit(cache=True, nogil=True)
+def auxRandAugDS(world_map, state, x0, y0, x1, y1):
+    stack = newStack(x0, y0, x1, y1)
+    top = 1
 
-    i = randAugIndex(x0, x1)
-    j = randAugIndex(y0, y1)
-    
-    if   i == x0 or i == x1:
-        for y in range(y0 + 1, y1):
-            # Interpolation - creates a slope. Then returns.
-            world_map[i][y] = int (world_map[i][y0] + (world_map[i][y1] - world_map[i][y0]) * (y - y0) / (y1 - y0))
-            world_map[i][y] = int (world_map[i][y0] + (world_map[i][y1] - world_map[i][y0]) * (y - y0) / (y1 - y0))
-        return
-    elif j == y0 or j == y1: 
-        for x in range(x0 + 1, x1):
-            # Interpolation - creates a slope. Then returns.
-            world_map[x][j] = int (world_map[x0][j] + (world_map[x0][j] - world_map[x1][j]) * (x - x0) / (x1 - x0))
-            world_map[x][j] = int (world_map[x0][j] + (world_map[x0][j] - world_map[x1][j]) * (x - x0) / (x1 - x0))
-        return
+    while top > 0:
+        top -= 1
+        n = 4 * top
+        x0 = stack[n]
+        y0 = stack[n + 1]
+        x1 = stack[n + 2]
+        y1 = stack[n + 3]
 
-    # This step:
-    Diamond(world_map, x0, y0, x1, y1, i, j)
-    Square (world_map, x0, y0, x1, y1, i, j)
+        if x0 == x1 and y0 == y1:
+            continue
 
-    # Next step:
-    auxRandAugDS(world_map, x0, y0, i, j)
-    auxRandAugDS(world_map, x0, j, i, y1)
-    auxRandAugDS(world_map, i, y0, x1, j)
-    auxRandAugDS(world_map, i, j, x1, y1)
+        state = xorshift(state)
+        i = randAugIndex(x0, x1, randBits(state))
+        state = xorshift(state)
+        j = randAugIndex(y0, y1, randBits(state))
 
+        if interpolate(world_map, x0, y0, x1, y1, i, j):
+            continue
+
+        # This step:
+        state = DiamondSquare(world_map, x0, y0, x1, y1, i, j, state)
+
+        # Next step:
+        top = pushAreas(stack, top, x0, y0, x1, y1, i, j)
+
+"""
+auxRandAugDS for heightmaps with side lengths 2^n + 1, as in the classic DS algorithm.
+Every area then has an exact midpoint, so it is used instead of a random index.
+@arg world_map: 2D non-jagged array representing a heightmap
+@arg state: Nonzero PRNG state, see newState()
+@arg x0,y0,x1,y1: Coordinates for corners (delimiters) of the area we're modifying 
+                  in this step.
+"""
+@njit(cache=True, nogil=True)
+def auxPowTwoDS(world_map, state, x0, y0, x1, y1):
+    stack = newStack(x0, y0, x1, y1)
+    top = 1
+
+    while top > 0:
+        top -= 1
+        n = 4 * top
+        x0 = stack[n]
+        y0 = stack[n + 1]
+        x1 = stack[n + 2]
+        y1 = stack[n + 3]
+
+        i = (x0 + x1) >> 1
+        j = (y0 + y1) >> 1
+
+        # Lines only remain when the side lengths differ, e.g. for a 17x33 heightmap
+        if interpolate(world_map, x0, y0, x1, y1, i, j):
+            continue
+
+        # This step:
+        state = DiamondSquare(world_map, x0, y0, x1, y1, i, j, state)
+
+        # Next step: a 2x2 area is split into 1x1 areas, which are already done
+        if x1 - x0 > 2 or y1 - y0 > 2:
+            top = pushAreas(stack, top, x0, y0, x1, y1, i, j)
+
+
+"""
+auxRandAugDS, or auxPowTwoDS if powTwo, for a HeightMap when numpy isn't installed.
+The steps are the same, but run on the flat heightmap data with a precomputed row stride,
+as indexing the HeightMap for every cell would make it slower than a list of lists.
+Random numbers are drawn from rng, which is faster than the xorshift PRNG in plain Python.
+@arg world_map: HeightMap, with its corners set
+@arg rng: random.Random
+@arg powTwo: Whether the side lengths of the heightmap are 2^n + 1
+"""
+def flatRandAugDS(world_map, rng, powTwo):
+    w = world_map.data
+    nx, ny = world_map.shape
+    rand = rng.getrandbits
+    stack = [(0, 0, nx - 1, ny - 1)]
+
+    while stack:
+        x0, y0, x1, y1 = stack.pop()
+
+        if powTwo:
+            i = (x0 + x1) >> 1
+            j = (y0 + y1) >> 1
+        else:
+            if x0 == x1 and y0 == y1:
+                continue
+            i = randAugIndex(x0, x1, rand(RAND_BITS))
+            j = randAugIndex(y0, y1, rand(RAND_BITS))
+
+        # Offsets of rows x0, i and x1 in w
+        r0 = x0 * ny
+        ri = i * ny
+        r1 = x1 * ny
+
+        # Lines are interpolated, see interpolate()
+        if i == x0 or i == x1:
+            h0 = w[ri + y0]
+            dh = w[ri + y1] - h0
+            for y in range(y0 + 1, y1):
+                w[ri + y] = h0 + dh * (y - y0) // (y1 - y0)
+            continue
+        elif j == y0 or j == y1:
+            h0 = w[r0 + j]
+            dh = w[r1 + j] - h0
+            for x in range(x0 + 1, x1):
+                w[x * ny + j] = h0 + dh * (x - x0) // (x1 - x0)
+            continue
+
+        # This step, see DiamondSquare()
+        amp_x = devAmplitude(x1 - x0)
+        amp_y = devAmplitude(y1 - y0)
+        amp_c = max(amp_x, amp_y)
+        a = w[r0 + y0]
+        b = w[r1 + y0]
+        c = w[r0 + y1]
+        d = w[r1 + y1]
+        centre = dev(amp_c, rand(RAND_BITS)) + int((a + b + c + d) / 4)
+        w[ri + j] = centre
+        w[r0 + j] = dev(amp_y, rand(RAND_BITS)) + int((a + c + centre) / 3)
+        w[r1 + j] = dev(amp_y, rand(RAND_BITS)) + int((b + d + centre) / 3)
+        w[ri + y0] = dev(amp_x, rand(RAND_BITS)) + int((a + b + centre) / 3)
+        w[ri + y1] = dev(amp_x, rand(RAND_BITS)) + int((c + d + centre) / 3)
+
+        # Next step, in the same order as pushAreas(). A 2x2 area of auxPowTwoDS is done.
+        if not powTwo or x1 - x0 > 2 or y1 - y0 > 2:
+            stack += ((i, j, x1, y1), (i, y0, x1, j), (x0, j, i, y1), (x0, y0, i, j))
+
+
+"""
+Runs one step of the DS algo on an area, which must have side lengths >= 2.
+@arg world_map: 2D non-jagged array representing a heightmap
+@arg state: Nonzero PRNG state, see newState()
+@arg x0,y0,x1,y1: Coordinates for corners (delimiters) of the area we're modifying 
+                  in this step.
+@arg powTwo: Whether the side lengths of the heightmap are 2^n + 1. See auxPowTwoDS.
+@return: Coordinates (i, j) for the centre of the area, which is a corner of the areas of the next step
+"""
+@njit(cache=True)
+def splitArea(world_map, state, x0, y0, x1, y1, powTwo):
+    if powTwo:
+        i = (x0 + x1) >> 1
+        j = (y0 + y1) >> 1
+    else:
+        state = xorshift(state)
+        i = randAugIndex(x0, x1, randBits(state))
+        state = xorshift(state)
+        j = randAugIndex(y0, y1, randBits(state))
+    DiamondSquare(world_map, x0, y0, x1, y1, i, j, state)
+    return i, j
+
+"""
+Returns whether the native versions of the DS algo are used for world_map: numba isn't installed,
+and the native module is built and supports world_map.
+@arg world_map: 2D non-jagged array representing a heightmap
+"""
+def useNative(world_map):
+    return (not NUMBA and aug_ds_native is not None and world_map.flags.c_contiguous
+            and world_map.dtype in (np.int16, np.intc))
+
+"""
+Returns whether the DS algo runs without holding the GIL on world_map, i.e. it is compiled by numba
+or native. Only then do threads processing areas in parallel speed it up.
+@arg world_map: 2D non-jagged array representing a heightmap
+"""
+def releasesGIL(world_map):
+    return NUMBA or useNative(world_map)
+
+"""
+Returns the function running the DS algo on an area: auxRandAugDS, or auxPowTwoDS if powTwo.
+Without numba, the native versions are used when they are built and support world_map.
+@arg world_map: 2D non-jagged array representing a heightmap
+@arg powTwo: Whether the side lengths of the heightmap are 2^n + 1
+"""
+def auxFunction(world_map, powTwo):
+    if useNative(world_map):
+        return aug_ds_native.auxPowTwoDS if powTwo else aug_ds_native.auxRandAugDS
+    return auxPowTwoDS if powTwo else auxRandAugDS
+
+"""
+Runs the DS algo on an area, processing the four areas of large splits in parallel.
+The four areas of a split modify their edges, so areas sharing an edge can't run at the same time.
+(x0, y0, i, j) and (i, j, x1, y1) only share the centre (i, j), which is never modified, and so do
+(x0, j, i, y1) and (i, y0, x1, j). So these two pairs run one after the other, each in parallel.
+Each area gets its own generator spawned from rng, so the result doesn't depend on thread timing.
+If the DS algo holds the GIL (see releasesGIL), the areas are processed one after the other instead.
+@arg world_map: 2D non-jagged array representing a heightmap
+@arg rng: numpy Generator for random numbers used on this area
+@arg x0,y0,x1,y1: Coordinates for corners (delimiters) of the area we're modifying 
+                  in this step.
+@arg powTwo: Whether the side lengths of the heightmap are 2^n + 1. See auxPowTwoDS.
+"""
+def parRandAugDS(world_map, rng, x0, y0, x1, y1, powTwo):
+    state = newState(rng)
+    if (x1 - x0) * (y1 - y0) <= PAR_THRESHOLD or x1 - x0 < 2 or y1 - y0 < 2:
+        auxFunction(world_map, powTwo)(world_map, state, x0, y0, x1, y1)
+        return
+
+    # This step. Both side lengths are >= 2, so the area is split.
+    i, j = splitArea(world_map, state, x0, y0, x1, y1, powTwo)
+
+    # Next step
+    areas = [(x0, y0, i, j), (x0, j, i, y1), (i, y0, x1, j), (i, j, x1, y1)]
+    rngs = rng.spawn(4)
+    if not releasesGIL(world_map):
+        for n in (0, 3, 1, 2):
+            parRandAugDS(world_map, rngs[n], *areas[n], powTwo)
+        return
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for pair in ((0, 3), (1, 2)):
+            futures = [executor.submit(parRandAugDS, world_map, rngs[n], *areas[n], powTwo) for n in pair]
+            for future in futures:
+                future.result()
 
 """
 Cleans up the edges of the heightmap.
@@ -178,46 +605,80 @@ This function solves that problem!
 @arg world_map: (Almost) finished, filled heightmap. 2D non-jagged array.
 """
 def edgeCleanup(world_map):
-    for x in range(len(world_map)):
-        if world_map[x][0] == 0:
-            if 0 < x < len(world_map) - 1:
-                world_map[x][0] = int((world_map[x-1][0] + world_map[x][1] + world_map[x+1][0]) / 3)
-        if world_map[x][-1] == 0:
-            if 0 < x < len(world_map) - 1:
-                world_map[x][-1] = int((world_map[x-1][-1] + world_map[x][-2] + world_map[x+1][-1]) / 3)
+    w = world_map
+    if np is None:
+        # A HeightMap. Check every edge cell in its flat data, where cell (x, y) is d[x*ny + y].
+        d = w.data
+        nx, ny = w.shape
+        for edge, inner in ((0, 1), (ny - 1, ny - 2)):
+            for n in range(ny, (nx - 1) * ny, ny):
+                if d[n + edge] == 0:
+                    d[n + edge] = int((d[n - ny + edge] + d[n + inner] + d[n + ny + edge]) / 3)
+        for edge, inner in ((0, 1), (nx - 1, nx - 2)):
+            e = edge * ny
+            n = inner * ny
+            for y in range(1, ny - 1):
+                if d[e + y] == 0:
+                    d[e + y] = int((d[e + y - 1] + d[n + y] + d[e + y + 1]) / 3)
+        return
+
+    # Only the (few) cells still at 0 are visited. They are fixed in order, so each cell
+    # in a run of zeroes averages with the already fixed cell before it.
+    for edge, inner in ((0, 1), (-1, -2)):
+        for x in np.flatnonzero(w[1:-1, edge] == 0) + 1:
+            w[x, edge] = int((int(w[x-1, edge]) + int(w[x, inner]) + int(w[x+1, edge])) / 3)
 
-    for y in range(len(world_map[0])):
-        if world_map[0][y] == 0:
-            if 0 < y < len(world_map[0]) - 1:
-                world_map[0][y] = int((world_map[0][y-1] + world_map[1][y] + world_map[0][y+1]) / 3)
-        if world_map[-1][y] == 0:
-            if 0 < y < len(world_map[0]) - 1:
-                world_map[-1][y] = int((world_map[-1][y-1] + world_map[-2][y] + world_map[-1][y+1]) / 3)
+    for edge, inner in ((0, 1), (-1, -2)):
+        for y in np.flatnonzero(w[edge, 1:-1] == 0) + 1:
+            w[edge, y] = int((int(w[edge, y-1]) + int(w[inner, y]) + int(w[edge, y+1])) / 3)
 
 
 """
 Randomized, augmented Diamond Square algorithm. 
 Can be used on any array sizes and dimensions: Squares, rectangles, etc.
-Initializes corner values & calls a recursive helper function.
-@arg world_map: Uninitialized heightmap. 2D non-jagged array.
+Initializes corner values & calls a helper function that runs the algorithm.
+@arg world_map: Uninitialized heightmap. 2D numpy integer array (or HeightMap) of zeroes.
+                 Without numpy, it must be a HeightMap. The algorithm then runs as plain Python,
+                 seeded by the random module, so the heightmaps differ from the ones numpy gives.
+                 Heights stay within about [-n/2, 3n/2] for side length n, so np.int16 is enough
+                 for side lengths up to ~20000, and uses half the memory bandwidth of np.int32.
 @arg seed: PRNG seed used for randomization and terrain variations
 """
 def randAugDS(world_map, seed):
-    random.seed(seed)
-    
+    if isinstance(world_map, HeightMap) and np is not None:
+        # Run on a numpy array, so the compiled algorithm can be used
+        randAugDS(world_map.asarray(), seed)
+        return world_map
+
     x0 = 0
-    x1 = len(world_map) - 1
+    x1 = world_map.shape[0] - 1
     y0 = 0
-    y1 = len(world_map[0]) - 1
+    y1 = world_map.shape[1] - 1
+
+    # Side lengths are 2^n + 1
+    powTwo = (x1 & (x1 - 1)) == 0 and (y1 & (y1 - 1)) == 0
+
+    if np is None:
+        # A HeightMap, processed by the plain Python algorithm on its data
+        rng = random.Random(seed)
+
+        # Initialize corners
+        for x, y in ((x0, y0), (x0, y1), (x1, y0), (x1, y1)):
+            world_map[x, y] = rng.randint(0, max(x1, y1))
+
+        # Call algorithm
+        flatRandAugDS(world_map, rng, powTwo)
+    else:
+        rng = np.random.default_rng(seed)
 
-    # Initialize corners
-    world_map[x0][y0] = random.randint(0, max(x1, y1))
-    world_map[x0][y1] = random.randint(0, max(x1, y1))
-    world_map[x1][y0] = random.randint(0, max(x1, y1))
-    world_map[x1][y1] = random.randint(0, max(x1, y1))
+        # Initialize corners
+        world_map[[x0, x0, x1, x1], [y0, y1, y0, y1]] = rng.integers(0, max(x1, y1), size=4, endpoint=True)
 
-    # Call algorithm
-    auxRandAugDS(world_map, x0, y0, x1, y1)
+        # Call algorithm
+        if (x1 - x0) * (y1 - y0) > PAR_THRESHOLD:
+            parRandAugDS(world_map, rng, x0, y0, x1, y1, powTwo)
+        else:
+            auxFunction(world_map, powTwo)(world_map, newState(rng), x0, y0, x1, y1)
 
     # Clean up any cells not modified by the algorithm (which only happens for some heightmap dimensions)
     edgeCleanup(world_map)
@@ -234,7 +695,7 @@ def exampleCall():
 
     # Do use 0 as initial values for the heightmap! 
     # This is necessary for edgeCleanup(world_map) to work correctly.
-    m = [[0 for j in range(45)] for i in range(25)]
+    m = np.zeros((25, 45), dtype=np.int16)
 
     # Prints in terminal
     printWorld(randAugDS(m, 2))
@@ -0,0 +1,205 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+#
+# Native (Cython) version of the hot loop of the augmented DS algorithm in aug_ds.py.
+# aug_ds uses it when numba is not installed, and the module has been built with
+#   cythonize -3 --inplace aug_ds_native.pyx
+# It mirrors auxRandAugDS/auxPowTwoDS step by step, and draws from the same xorshift64 PRNG,
+# so it gives the same heightmaps as the Python version.
+
+from libc.stdlib cimport malloc, free
+
+ctypedef fused height_t:
+    short
+    int
+
+# Set from aug_ds by setFactors()
+cdef long long RAND_BITS = 16
+cdef long long HEIGHT_VARIATION_NUM = 1
+cdef long long HEIGHT_VARIATION_DEN = 5
+cdef long long RANDOMIZATION_SCALE_NUM = 1
+cdef long long RANDOMIZATION_SCALE_DEN = 5
+
+"""
+Sets RAND_BITS, and the HEIGHT_VARIATION and RANDOMIZATION_SCALE fractions, to the ones used by aug_ds.
+"""
+def setFactors(long long rand_bits, long long hv_num, long long hv_den, long long rs_num, long long rs_den):
+    global RAND_BITS, HEIGHT_VARIATION_NUM, HEIGHT_VARIATION_DEN, RANDOMIZATION_SCALE_NUM, RANDOMIZATION_SCALE_DEN
+    RAND_BITS = rand_bits
+    HEIGHT_VARIATION_NUM = hv_num
+    HEIGHT_VARIATION_DEN = hv_den
+    RANDOMIZATION_SCALE_NUM = rs_num
+    RANDOMIZATION_SCALE_DEN = rs_den
+
+
+"""
+a // b, rounding down like python does. b must be positive.
+"""
+cdef inline long long floorDiv(long long a, long long b) noexcept nogil:
+    cdef long long q = a / b
+    if a % b != 0 and a < 0:
+        q -= 1
+    return q
+
+"""
+Advances the xorshift64 PRNG state, and returns a random number in [0, 2^RAND_BITS) from it.
+"""
+cdef inline long long randBits(unsigned long long *state) noexcept nogil:
+    cdef unsigned long long s = state[0]
+    s ^= s << 13
+    s ^= s >> 7
+    s ^= s << 17
+    state[0] = s
+    return <long long>(s >> (64 - RAND_BITS))
+
+"""
+x / 3, rounded towards zero, using a multiply and shift. Exact for |x| < 2^31.
+"""
+cdef inline long long div3(long long x) noexcept nogil:
+    if x >= 0:
+        return (x * 0xAAAAAAABLL) >> 33
+    return -((-x * 0xAAAAAAABLL) >> 33)
+
+cdef inline long long devAmplitude(long long span) noexcept nogil:
+    return (span * HEIGHT_VARIATION_NUM) / HEIGHT_VARIATION_DEN
+
+cdef inline long long dev(long long amplitude, long long r) noexcept nogil:
+    return (((2*amplitude + 1) * r) >> RAND_BITS) - amplitude
+
+cdef inline long long randAugIndex(long long i0, long long i1, long long r) noexcept nogil:
+    cdef long long i
+    if i0 == i1 or i1 < i0:
+        return i0
+    elif i0 + 1 == i1:
+        return i0
+    elif i0 + 2 == i1:
+        return i0 + 1
+    i = i0 + ((i1 - i0) * (RANDOMIZATION_SCALE_NUM * r + (RANDOMIZATION_SCALE_DEN << RAND_BITS))) \
+        / (RANDOMIZATION_SCALE_DEN << (RAND_BITS + 1))
+    if i == i0:
+        i += 1
+    elif i == i1:
+        i -= 1
+    return i
+
+cdef inline void DiamondSquare(height_t[:, ::1] w, long long x0, long long y0, long long x1, long long y1,
+                               long long i, long long j, unsigned long long *state) noexcept nogil:
+    cdef long long amp_x = devAmplitude(x1 - x0)
+    cdef long long amp_y = devAmplitude(y1 - y0)
+    cdef long long amp_c = amp_x if amp_x > amp_y else amp_y
+    cdef long long a = w[x0, y0]
+    cdef long long b = w[x1, y0]
+    cdef long long c = w[x0, y1]
+    cdef long long d = w[x1, y1]
+    # C division truncates, like int(... / 4) in python
+    cdef long long centre = dev(amp_c, randBits(state)) + (a + b + c + d) / 4
+    w[i, j] = <height_t>centre
+
+    w[x0, j] = <height_t>(dev(amp_y, randBits(state)) + div3(a + c + centre))
+    w[x1, j] = <height_t>(dev(amp_y, randBits(state)) + div3(b + d + centre))
+    w[i, y0] = <height_t>(dev(amp_x, randBits(state)) + div3(a + b + centre))
+    w[i, y1] = <height_t>(dev(amp_x, randBits(state)) + div3(c + d + centre))
+
+cdef inline bint interpolate(height_t[:, ::1] w, long long x0, long long y0, long long x1, long long y1,
+                             long long i, long long j) noexcept nogil:
+    cdef long long h0, dh, x, y
+    if i == x0 or i == x1:
+        h0 = w[i, y0]
+        dh = w[i, y1] - h0
+        for y in range(y0 + 1, y1):
+            w[i, y] = <height_t>(h0 + floorDiv(dh * (y - y0), y1 - y0))
+        return True
+    elif j == y0 or j == y1:
+        h0 = w[x0, j]
+        dh = w[x1, j] - h0
+        for x in range(x0 + 1, x1):
+            w[x, j] = <height_t>(h0 + floorDiv(dh * (x - x0), x1 - x0))
+        return True
+    return False
+
+"""
+Runs auxRandAugDS (or auxPowTwoDS if powTwo) on the area. The PRNG state stays in a local.
+The stack holds (x0, y0, x1, y1) areas, and must have room for 3 * min(x1 - x0, y1 - y0) + 1 of them.
+"""
+cdef void auxDS(height_t[:, ::1] w, unsigned long long state, long long *stack,
+                long long x0, long long y0, long long x1, long long y1, bint powTwo) noexcept nogil:
+    cdef long long top = 1
+    cdef long long i, j, n
+    stack[0] = x0
+    stack[1] = y0
+    stack[2] = x1
+    stack[3] = y1
+
+    while top > 0:
+        top -= 1
+        n = 4 * top
+        x0 = stack[n]
+        y0 = stack[n + 1]
+        x1 = stack[n + 2]
+        y1 = stack[n + 3]
+
+        if powTwo:
+            i = (x0 + x1) >> 1
+            j = (y0 + y1) >> 1
+        else:
+            if x0 == x1 and y0 == y1:
+                continue
+            i = randAugIndex(x0, x1, randBits(&state))
+            j = randAugIndex(y0, y1, randBits(&state))
+
+        if interpolate(w, x0, y0, x1, y1, i, j):
+            continue
+
+        DiamondSquare(w, x0, y0, x1, y1, i, j, &state)
+
+        if powTwo and x1 - x0 <= 2 and y1 - y0 <= 2:
+            continue
+
+        # Pushed in reverse, so (x0, y0, i, j) is processed first
+        stack[n] = i
+        stack[n + 1] = j
+        stack[n + 2] = x1
+        stack[n + 3] = y1
+        stack[n + 4] = i
+        stack[n + 5] = y0
+        stack[n + 6] = x1
+        stack[n + 7] = j
+        stack[n + 8] = x0
+        stack[n + 9] = j
+        stack[n + 10] = i
+        stack[n + 11] = y1
+        stack[n + 12] = x0
+        stack[n + 13] = y0
+        stack[n + 14] = i
+        stack[n + 15] = j
+        top += 4
+
+"""
+Allocates a stack for auxDS, and runs it.
+"""
+cdef runAuxDS(height_t[:, ::1] world_map, unsigned long long state,
+              long long x0, long long y0, long long x1, long long y1, bint powTwo):
+    # Each step shrinks both side lengths by at least 1, and leaves 3 areas on the stack
+    cdef long long size = 3 * (x1 - x0 if x1 - x0 < y1 - y0 else y1 - y0) + 1
+    cdef long long *stack = <long long *>malloc(4 * size * sizeof(long long))
+    if stack == NULL:
+        raise MemoryError()
+    try:
+        with nogil:
+            auxDS(world_map, state, stack, x0, y0, x1, y1, powTwo)
+    finally:
+        free(stack)
+
+
+"""
+Native aug_ds.auxRandAugDS, for C contiguous int16 or int32 heightmaps.
+"""
+def auxRandAugDS(height_t[:, ::1] world_map, unsigned long long state, long long x0, long long y0,
+                 long long x1, long long y1):
+    runAuxDS(world_map, state, x0, y0, x1, y1, False)
+
+"""
+Native aug_ds.auxPowTwoDS, for C contiguous int16 or int32 heightmaps.
+"""
+def auxPowTwoDS(height_t[:, ::1] world_map, unsigned long long state, long long x0, long long y0,
+                long long x1, long long y1):
+    runAuxDS(world_map, state, x0, y0, x1, y1, True)